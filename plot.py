@@ -1,114 +1,180 @@
+import glob
+import multiprocessing
 import os
-import csv
-import matplotlib.pyplot as plt
+import re
 import numpy
 
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# test name up to the first underscore, mapkind after it; mapkinds may
+# themselves contain underscores.
+_FILENAME_RE = re.compile(r"([^_]+)_(.+)")
+
 def parse_filename(filename: str):
-    filename = filename.split('.')[0]
-    parts = filename.split("_")
+    (stem, _) = os.path.splitext(filename)
+    m = _FILENAME_RE.match(stem)
 
-    return (parts[0], parts[1])
+    return (m.group(1), m.group(2))
 
 def plot(filename, test, mapkind):
-    if test == "churn":
-        plot_churn(filename, mapkind)
-    elif test == "grow":
-        plot_grow(filename, mapkind)
-    elif test == "probe":
-        plot_probe(filename, mapkind)
+    plot_fn = _DISPATCH.get(test)
+    if plot_fn is not None:
+        plot_fn(filename, mapkind)
 
-def blank_csv_data():
-    csv_data = {}
+# the columns read_csv cares about: load_factor, meta_bits, then the
+# eight metric columns. Column 1 (size) is unused.
+_CSV_USECOLS = (0, 2, 3, 4, 5, 6, 7, 8, 9, 10)
 
-    csv_data["a_mean"] = {}
-    csv_data["a_50"] = {}
-    csv_data["a_95"] = {}
-    csv_data["a_99"] = {}
+_METRIC_NAMES = ["a_mean", "a_50", "a_95", "a_99", "b_mean", "b_50", "b_95", "b_99"]
 
-    csv_data["b_mean"] = {}
-    csv_data["b_50"] = {}
-    csv_data["b_95"] = {}
-    csv_data["b_99"] = {}
+def read_csv(filename):
+    if pandas is None:
+        return read_csv_stdlib(filename)
+
+    # parsing happens in pandas' C engine; the data is purely numeric so
+    # NA detection can be skipped too.
+    df = pandas.read_csv(
+        "out/" + filename,
+        header=None,
+        usecols=_CSV_USECOLS,
+        dtype={i: numpy.int32 if i == 2 else numpy.float64 for i in _CSV_USECOLS},
+        na_filter=False,
+    )
 
-    return csv_data
+    # struct-of-arrays: one column array per metric, plus parallel
+    # load_factor/meta_bits arrays for filtering.
+    data = {
+        "load_factor": df[0].to_numpy(),
+        "meta_bits": df[2].to_numpy(),
+    }
 
-def read_csv(filename):
-    data = blank_csv_data()
-    with open("out/" + filename, 'r') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            load_factor = float(row[0])
-            # TODO size = row[1]
-            meta_bits = int(row[2])
-
-            data["a_mean"][(load_factor, meta_bits)] = float(row[3])
-            data["a_50"][(load_factor, meta_bits)] = float(row[4])
-            data["a_95"][(load_factor, meta_bits)] = float(row[5])
-            data["a_99"][(load_factor, meta_bits)] = float(row[6])
-
-            data["b_mean"][(load_factor, meta_bits)] = float(row[7])
-            data["b_50"][(load_factor, meta_bits)] = float(row[8])
-            data["b_95"][(load_factor, meta_bits)] = float(row[9])
-            data["b_99"][(load_factor, meta_bits)] = float(row[10])
+    for (column, name) in enumerate(_METRIC_NAMES, start=3):
+        data[name] = df[column].to_numpy()
 
     return data
 
-def make_plot(plot_filename, csv_data, plot_names):
-    fig, ax = plt.subplots(int(len(plot_names) / 2), figsize=(8, 8), ncols=2)
-    fig.suptitle("operations at load factor")
-    fig.supxlabel("load factor")
+def read_csv_stdlib(filename):
+    # fallback when pandas is unavailable: numpy's loadtxt parses
+    # straight into a preallocated float64 array, with no per-row Python
+    # lists or boxed floats.
+    arr = numpy.loadtxt(
+        "out/" + filename,
+        delimiter=",",
+        usecols=_CSV_USECOLS,
+        dtype=numpy.float64,
+        ndmin=2,
+    ).T
+
+    data = {
+        "load_factor": arr[0],
+        "meta_bits": arr[1].astype(numpy.int32),
+    }
+
+    for (column, name) in enumerate(_METRIC_NAMES, start=2):
+        data[name] = arr[column]
+
+    return data
+
+def meta_bits_groups(csv_data):
+    # one sort groups the rows by meta_bits (with load_factor ascending
+    # within each group), instead of scanning the arrays once per group.
+    order = numpy.lexsort((csv_data["load_factor"], csv_data["meta_bits"]))
+    meta_bits_sorted = csv_data["meta_bits"][order]
+    splits = numpy.flatnonzero(numpy.diff(meta_bits_sorted)) + 1
+    return numpy.split(order, splits)
+
+def pyplot():
+    # importing pyplot costs hundreds of milliseconds (font cache,
+    # backend setup), so defer it until a plot is actually produced; a
+    # run over an empty out/ never pays it. Repeat calls hit the module
+    # cache.
+    import matplotlib
+    # non-interactive backend: no GUI toolkit to initialize, safe to
+    # render from worker processes.
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+def make_plot(plot_filename, fig, ax, csv_data, plot_names, groups):
+    # collect the legend handles from the first subplot's lines; one line
+    # per meta_bits group is enough, and fig.legend() with explicit
+    # handles skips walking every artist of every subplot.
+    handles = []
+
+    all_meta_bits = csv_data["meta_bits"]
+    all_load_factors = csv_data["load_factor"]
 
     for (i, (plot_name, data_name)) in zip(numpy.ndindex(ax.shape), plot_names):
         plot_data = csv_data[data_name]
 
-        meta_bit_counts = sorted(list(set(x[1] for x in plot_data)))
-    
-        ax[i].set(ylabel="operations")
-        ax[i].set_yscale('log')
-        ax[i].set_title(plot_name)
-
-        for meta_bits in meta_bit_counts:
-            load_factors = set()
-            for (l, b) in plot_data:
-                if b == meta_bits:
-                    load_factors.add(l)
-
-            load_factors = sorted(list(load_factors))
-            data = [plot_data[(load_factor, meta_bits)] for load_factor in load_factors]
-            ax[i].plot(load_factors, data, label=f"{meta_bits} meta bits" if i == (0, 0) else "")
-        
-    plt.figlegend()
-    plt.savefig(plot_filename)
-    plt.close(fig)
+        a = ax[i]
+        a.set(ylabel="operations")
+        a.set_yscale('log')
+        a.set_title(plot_name)
+        plot_fn = a.plot
+
+        for group in groups:
+            meta_bits = all_meta_bits[group[0]]
+            load_factors = all_load_factors[group]
+            data = plot_data[group]
+
+            lines = plot_fn(load_factors, data, label=f"{meta_bits} meta bits" if i == (0, 0) else "")
+            if i == (0, 0):
+                handles.extend(lines)
+
+    fig.legend(handles=handles)
+    fig.savefig(plot_filename, format='png', dpi=90)
 
 def make_plots(filename, op_name, mapkind, a_name, b_name):
+    out_path = f"plot/{mapkind}/{op_name}.png"
+
+    # incremental runs: skip files whose plot is already newer than the
+    # CSV it was drawn from.
+    csv_mtime = os.path.getmtime("out/" + filename)
+    if os.path.exists(out_path) and os.path.getmtime(out_path) >= csv_mtime:
+        return
+
+    plt = pyplot()
+
     data = read_csv(filename)
 
-    if not(os.path.exists(f"plot/{mapkind}")):
-        os.mkdir(f"plot/{mapkind}")
+    # the row grouping is a property of the file, not of the metric, so
+    # compute it once and share it across all eight subplots.
+    groups = meta_bits_groups(data)
 
-    make_plot(
-        f"plot/{mapkind}_{op_name}_{a_name}", 
-        data,
-        [
-            (f"mean {a_name}", "a_mean"), 
-            (f"50th percentile {a_name}", "a_50"), 
-            (f"95th percentile {a_name}", "a_95"), 
-            (f"99th percentile {a_name}", "a_99"),
-        ]
-    )
+    # exist_ok: several pool workers may share a mapkind.
+    os.makedirs(f"plot/{mapkind}", exist_ok=True)
+
+    # all eight metrics render into one figure and one save: a_* across
+    # the top row, b_* across the bottom.
+    fig, ax = plt.subplots(2, figsize=(16, 8), ncols=4, sharex=True)
+    fig.suptitle("operations at load factor")
+    fig.supxlabel("load factor")
 
     make_plot(
-        f"plot/{mapkind}_{op_name}_{b_name}", 
+        out_path,
+        fig,
+        ax,
         data,
         [
-            (f"mean {b_name}", "b_mean"), 
-            (f"50th percentile {b_name}", "b_50"), 
-            (f"95th percentile {b_name}", "b_95"), 
+            (f"mean {a_name}", "a_mean"),
+            (f"50th percentile {a_name}", "a_50"),
+            (f"95th percentile {a_name}", "a_95"),
+            (f"99th percentile {a_name}", "a_99"),
+            (f"mean {b_name}", "b_mean"),
+            (f"50th percentile {b_name}", "b_50"),
+            (f"95th percentile {b_name}", "b_95"),
             (f"99th percentile {b_name}", "b_99"),
-        ]
+        ],
+        groups,
     )
 
+    plt.close(fig)
+
 def plot_grow(filename, mapkind):
     make_plots(filename, "grow", mapkind, "probes", "writes")
 
@@ -118,12 +184,21 @@ def plot_churn(filename, mapkind):
 def plot_probe(filename, mapkind):
     make_plots(filename, "probe", mapkind, "present", "absent")
 
+_DISPATCH = {
+    "churn": plot_churn,
+    "grow": plot_grow,
+    "probe": plot_probe,
+}
+
+
+if __name__ == "__main__":
+    if not(os.path.exists('plot')):
+        os.mkdir('plot')
 
-if not(os.path.exists('plot')):
-    os.mkdir('plot')
+    filenames = [os.path.basename(path) for path in glob.glob("out/*.csv")]
+    jobs = [(filename, *parse_filename(filename)) for filename in filenames]
 
-for file in os.listdir("out"):
-    filename = os.fsdecode(file)
-    if filename.endswith(".csv"):
-        (test, mapkind) = parse_filename(filename)
-        plot(filename, test, mapkind)
+    # each file renders to its own figure and output path, so the files
+    # can be plotted in parallel.
+    with multiprocessing.Pool() as pool:
+        pool.starmap(plot, jobs)